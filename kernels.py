@@ -0,0 +1,180 @@
+"""
+Numba kernels behind the scoring and similarity hot paths.
+
+Kept apart from model.py so that module can be compiled ahead of time
+with mypyc, which would otherwise turn these functions into native code
+Numba cannot JIT.
+"""
+
+from typing import Any
+
+import numba
+import numpy as np
+
+
+# Kernels are compiled eagerly from their signatures at import (cached on disk),
+# so the first score call does not pay for JIT compilation. Fastmath leaves out
+# nnan/ninf, so inf and NaN keep their IEEE meaning instead of being undefined.
+_FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+_JIT: dict[str, Any] = dict(cache=True, fastmath=_FASTMATH, error_model="numpy")
+
+
+@numba.njit("float64(float64, float64, float64)", **_JIT)
+def willingness_to_pay(ref, value, price_sensitivty):
+    # Calibrate baseline so that product with value 0.5
+    # is worth reference price
+    if value <= 0.5:
+        return ref * (value * 2.0)
+    max_premium = 0.6 / price_sensitivty
+    return ref * (1.0 + max_premium * (value - 0.5))
+
+
+_TANH_CLAMP = 4.97  # where the approximant below reaches 1
+
+
+@numba.njit("float64(float64)", **_JIT)
+def fast_sigmoid(x):
+    # 1 / (1 + exp(-x)) == 0.5 + 0.5 * tanh(x / 2), with tanh from its 7/6
+    # Lambert continued-fraction approximant (|error| < 1e-4 inside the clamp)
+    t = min(max(0.5 * x, -_TANH_CLAMP), _TANH_CLAMP)
+    t2 = t * t
+    num = t * (135135.0 + t2 * (17325.0 + t2 * (378.0 + t2)))
+    den = 135135.0 + t2 * (62370.0 + t2 * (3150.0 + 28.0 * t2))
+    return 0.5 + 0.5 * (num / den)
+
+
+@numba.njit("float64(float64, float64, float64, float64, float64)", **_JIT)
+def score_core(ref, rel_uncert, value, price, price_sensitivty):
+    # Both are divisors below; a zero used to raise ZeroDivisionError. Negative
+    # values (features beyond max_distance) still score as they always have.
+    if price_sensitivty == 0.0:
+        raise ValueError("price_sensitivty must be non-zero")
+    wtp = willingness_to_pay(ref, value, price_sensitivty)
+    if wtp == 0.0:
+        raise ValueError(
+            "willingness to pay must be non-zero (zero value or reference price)"
+        )
+
+    # Get the percentage difference
+    rel_delta = (wtp - price) / wtp
+
+    # If rel_delta between wtp and price is within
+    # the relative uncertainty we consider it to
+    # be equal to the market price.
+    if abs(rel_delta) < rel_uncert:
+        rel_delta = 0.0
+
+    if rel_delta >= 0:
+        # If delta is positive (better price)
+        # We create a positive feeling with diminishing returns
+        feeling = rel_delta**0.65
+    else:
+        # If delta is negative (worse price)
+        # We create a negative feeling with diminishing returns
+        # loss aversion: overpriced hurts ~2x
+        feeling = -2 * ((-rel_delta) ** 0.65)
+
+    k_eff = 6.0 * price_sensitivty
+
+    # Use sigmoid to determine score
+    score = 100.0 * fast_sigmoid(k_eff * feeling)
+    return max(0.0, min(100.0, score))
+
+
+@numba.njit("float64[:](float64[:], float64, float64, float64, float64)", **_JIT)
+def score_core_vec(prices, ref, rel_uncert, value, price_sensitivty):
+    # Score a whole price sweep against one reference
+    scores = np.empty_like(prices)
+    for i in range(prices.shape[0]):
+        scores[i] = score_core(ref, rel_uncert, value, prices[i], price_sensitivty)
+    return scores
+
+
+@numba.njit(
+    "float64[:](float64[:], float64[:], float64[:], float64[:], float64)", **_JIT
+)
+def score_core_rows(prices, refs, rel_uncerts, values, price_sensitivty):
+    # Score rows that each carry their own reference
+    scores = np.empty_like(prices)
+    for i in range(prices.shape[0]):
+        scores[i] = score_core(
+            refs[i], rel_uncerts[i], values[i], prices[i], price_sensitivty
+        )
+    return scores
+
+
+# Byte-lane constants for the packed (SWAR) L1 distance
+_MSB = np.uint64(0x8080808080808080)
+_LO_BYTES = np.uint64(0x00FF00FF00FF00FF)
+_SUM_LANES = np.uint64(0x0001000100010001)
+PACK_DIMS = 8  # one byte per dimension in a uint64
+_PACK_MAX = 127  # 7-bit lanes, so (a | 0x80) - b never borrows across bytes
+
+
+def pack_features(features: list[int]) -> np.uint64 | None:
+    """
+    Pack a short non-negative feature vector into one uint64, or None.
+
+    Model code packs through pack_range and pack_block; this wrapper is
+    kept for the tests, which pack single vectors.
+    """
+    packed = pack_range(features, min(features, default=0), max(features, default=0))
+    return None if packed is None else np.uint64(packed)
+
+
+def pack_range(features: list[int], lo: int, hi: int) -> int | None:
+    """
+    Like pack_features, for int features whose min and max are already
+    known, returning the packed word as a Python int.
+    """
+    if len(features) > PACK_DIMS or lo < 0 or hi > _PACK_MAX:
+        return None
+    # Byte i holds dimension i, as in (f_0 | f_1 << 8 | ...)
+    return int.from_bytes(bytes(features), "little")
+
+
+def pack_block(rows: np.ndarray, lo: int, hi: int) -> np.ndarray | None:
+    """
+    pack_range for a whole (n, D) block of rows whose overall min and max
+    are lo and hi, as one uint64 array, or None if any row does not fit.
+    """
+    if rows.shape[1] > PACK_DIMS or lo < 0 or hi > _PACK_MAX:
+        return None
+    lanes = np.zeros((rows.shape[0], PACK_DIMS), dtype=np.uint8)
+    lanes[:, : rows.shape[1]] = rows
+    return lanes.view("<u8")[:, 0]
+
+
+@numba.njit("int64(uint64, uint64)", **_JIT)
+def l1_u64(a, b):
+    # Per byte: (a | 0x80) - b = 0x80 + a - b, with the top bit set iff a >= b
+    ge = ((a | _MSB) - b) ^ _MSB
+    lt = ((b | _MSB) - a) ^ _MSB
+    # Widen each lane's top bit into a full byte mask of the a >= b lanes
+    mask = (((ge ^ _MSB) & _MSB) >> np.uint64(7)) * np.uint64(0xFF)
+    diff = (ge & mask) | (lt & ~mask)
+    # Horizontal byte sum: pairs into 16-bit lanes, then fold the four lanes
+    diff = (diff & _LO_BYTES) + ((diff >> np.uint64(8)) & _LO_BYTES)
+    return np.int64((diff * _SUM_LANES) >> np.uint64(48))
+
+
+@numba.njit("int64[:](uint64, uint64[:])", **_JIT)
+def l1_packed(query, rows):
+    distances = np.empty(rows.shape[0], dtype=np.int64)
+    for i in range(rows.shape[0]):
+        distances[i] = l1_u64(query, rows[i])
+    return distances
+
+
+@numba.njit("UniTuple(int64, 2)(uint64, uint64[:], int32[:])", **_JIT)
+def nearest_packed(query, rows, ranks):
+    # Row closest to query, ties going to the lowest rank; one pass instead
+    # of distance, max, tie and argmin calls that each pay NumPy overhead
+    best, best_distance = 0, l1_u64(query, rows[0])
+    for i in range(1, rows.shape[0]):
+        distance = l1_u64(query, rows[i])
+        if distance < best_distance or (
+            distance == best_distance and ranks[i] < ranks[best]
+        ):
+            best, best_distance = i, distance
+    return best, best_distance
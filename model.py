@@ -1,9 +1,24 @@
+from bisect import bisect_left, insort
+from collections.abc import Iterator, Mapping
 from dataclasses import dataclass, field
-import statistics
-import math
+from types import MappingProxyType
+from typing import Any
 
+import numpy as np
 
-@dataclass
+from kernels import (
+    PACK_DIMS,
+    l1_packed,
+    nearest_packed,
+    pack_block,
+    pack_range,
+    score_core,
+    score_core_rows,
+    willingness_to_pay,
+)
+
+
+@dataclass(slots=True, frozen=True)
 class Product:
     price: float
     sku: str
@@ -11,86 +26,646 @@ class Product:
     features: list[int]
 
 
-@dataclass
+def _sorted_median(ordered: list[float]) -> float:
+    # Averaging the two middle elements covers odd and even n alike
+    n = len(ordered)
+    return (ordered[(n - 1) // 2] + ordered[n // 2]) * 0.5
+
+
+def _kth_deviation(ordered: list[float], median: float, split: int, k: int) -> float:
+    # k-th smallest (0-based) |x - median| over two ascending runs,
+    # left[i] = median - ordered[split - 1 - i] and
+    # right[i] = ordered[split + i] - median; bisect on how many of the
+    # k + 1 smallest come from the left run
+    lo, hi = max(0, k + 1 - (len(ordered) - split)), min(k + 1, split)
+    while lo < hi:
+        i = (lo + hi) // 2
+        if median - ordered[split - 1 - i] < ordered[split + k - i] - median:
+            lo = i + 1
+        else:
+            hi = i
+    # The k-th smallest is the larger of the last element taken from each run
+    last_left = median - ordered[split - lo] if lo > 0 else 0.0
+    last_right = ordered[split + k - lo] - median if lo <= k else 0.0
+    return max(last_left, last_right)
+
+
+def _sorted_mad(ordered: list[float], median: float) -> float:
+    # The deviations of ascending prices are already two sorted runs, so
+    # their median is read off by bisection rather than sorted again
+    n = len(ordered)
+    split = bisect_left(ordered, median)
+    return (
+        _kth_deviation(ordered, median, split, (n - 1) // 2)
+        + _kth_deviation(ordered, median, split, n // 2)
+    ) * 0.5
+
+
+def _price_stats(prices: list[float]) -> tuple[float, float, float]:
+    """Median, MAD and relative uncertainty (MAD / median) of ascending prices."""
+    if len(prices) == 1:
+        # A single observation has no spread
+        return prices[0], 0.0, 0.0
+    price_ref = _sorted_median(prices)
+    # Compute MAD from the absolute deviations
+    mad = _sorted_mad(prices, price_ref)
+    # Create relative uncertainty
+    return price_ref, mad, mad / price_ref
+
+
+# Rows per block when scanning large categories in memory_refrence
+_TILE = 64
+# Default match threshold of memory_refrence, which access_memory uses
+_SIMILARITY_PCT = 0.8
+# Upper bound on query x row x dimension cells per batch similarity block
+_BATCH_CELLS = 1 << 20
+
+
+def _grow(values: np.ndarray, capacity: int) -> np.ndarray:
+    # Keeps the existing rows; the new tail is filler until written
+    return np.resize(values, (capacity,) + values.shape[1:])
+
+
+# Feature buffers start as int8 and widen along this ladder as needed
+_INT_TYPES = (np.int8, np.int16, np.int32, np.int64)
+_INT_DTYPES = [np.dtype(t) for t in _INT_TYPES]
+_INT_BOUNDS = [
+    (np.dtype(t), int(np.iinfo(t).min), int(np.iinfo(t).max)) for t in _INT_TYPES
+]
+
+
+# |row - query| summed over D dimensions stays below 2 * D * bound, so
+# features under _FEATURE_LIMIT // D in magnitude keep every int64 L1
+# distance (and feature sum) from wrapping
+_FEATURE_LIMIT = 2**62
+_DTYPE_BOUNDS = {dtype: (dtype_min, dtype_max) for dtype, dtype_min, dtype_max in _INT_BOUNDS}
+
+
+def _feature_bound(dims: int) -> int:
+    return _FEATURE_LIMIT // max(dims, 1)
+
+
+def _whole(product: Product, f: Any) -> int:
+    if not float(f).is_integer():
+        raise ValueError(
+            f"Product {product.sku!r} has non-integer feature {f!r}, "
+            f"but memory stores integer features"
+        )
+    return int(f)
+
+
+def _checked_features(product: Product) -> tuple[list[int], int, int, int]:
+    """
+    Features of product as Python ints, with their min, max and sum.
+
+    Raises ValueError for fractional features, which the integer buffers
+    would truncate, and for features of magnitude _FEATURE_LIMIT // D or
+    more, whose L1 distances could wrap around in int64. Callers check
+    before touching memory, so a rejected product leaves it as it was.
+    """
+    # Elements may be whole-number floats or NumPy scalars; as Any, mypyc
+    # does not unbox them to native ints
+    features: list[Any] = product.features
+    for f in features:
+        if type(f) is not int:
+            features = [_whole(product, f) for f in features]
+            break
+    lo, hi = (min(features), max(features)) if features else (0, 0)
+    bound = _feature_bound(len(features))
+    if lo <= -bound or hi >= bound:
+        raise ValueError(
+            f"Product {product.sku!r} has features {product.features}, but "
+            f"memory stores features below {bound} in magnitude, so their "
+            f"int64 distances cannot wrap"
+        )
+    return features, lo, hi, sum(features)
+
+
+def _fitting_dtype(lo: int, hi: int) -> np.dtype:
+    # Smallest integer dtype holding every value in [lo, hi]
+    for dtype, dtype_min, dtype_max in _INT_BOUNDS:
+        if dtype_min <= lo and hi <= dtype_max:
+            return dtype
+    return _INT_DTYPES[-1]
+
+
+def _fit_features(values: np.ndarray, lo: int, hi: int) -> np.ndarray:
+    # Widen the buffer for the rare vector that does not fit; checked
+    # features always fit int64, so from there on this is a bounds test
+    dtype_min, dtype_max = _DTYPE_BOUNDS[values.dtype]
+    if dtype_min <= lo and hi <= dtype_max:
+        return values
+    return values.astype(_fitting_dtype(lo, hi))
+
+
+def _query_dtype(features: np.dtype, rows: np.dtype) -> np.dtype:
+    # One step wider than both the query and the stored rows, so
+    # row - query cannot wrap (up to int64)
+    step = max(_INT_DTYPES.index(rows), _INT_DTYPES.index(features))
+    return _INT_DTYPES[min(step + 1, len(_INT_DTYPES) - 1)]
+
+
+@dataclass(slots=True, eq=False, repr=False)
+class SkuStore:
+    """
+    Prices remembered for one SKU, plus where its feature rows live in
+    the category store.
+
+    Behaves like the old list of (price, features) tuples, while exposing
+    prices and features as arrays for the numeric code paths. Its own
+    columns are plain lists: appends happen on every eval_product, and a
+    list append is far cheaper than a NumPy scalar write.
+    """
+
+    _prices: list[float]  # in order seen
+    _sorted: list[float]  # the same prices kept ascending, see append
+    _rows: list[int]  # matching rows of category.features
+    category: "_CatStore" = field(repr=False)
+    sid: int  # interned SKU id
+    rank: int  # order of first sighting within its category
+    # (median, mad, rel_uncert), dropped when a new price is appended
+    stats: tuple[float, float, float] | None = None
+
+    @classmethod
+    def empty(cls, category: "_CatStore", sid: int, rank: int) -> "SkuStore":
+        return cls(
+            _prices=[], _sorted=[], _rows=[], category=category, sid=sid, rank=rank
+        )
+
+    @property
+    def prices(self) -> np.ndarray:
+        return np.array(self._prices, dtype=np.float64)
+
+    @property
+    def features(self) -> np.ndarray:
+        return self.category.features[self._rows]
+
+    def append(self, price: float, row: int) -> None:
+        price = float(price)
+        self._prices.append(price)
+        self._rows.append(row)
+        # Insertion into the sorted copy keeps the median O(1)
+        insort(self._sorted, price)
+        self.stats = None
+
+    def price_stats(self) -> tuple[float, float, float]:
+        if self.stats is None:
+            self.stats = _price_stats(self._sorted)
+        return self.stats
+
+    def __len__(self) -> int:
+        return len(self._prices)
+
+    def __getitem__(self, i: int) -> tuple[float, list[int]]:
+        return self._prices[i], self.category.features[self._rows[i]].tolist()
+
+    def __iter__(self) -> Iterator[tuple[float, list[int]]]:
+        return zip(self._prices, self.features.tolist())
+
+    def __eq__(self, other: object) -> bool:
+        # Same (price, features) history in the same order, also against
+        # the plain list of (price, features) pairs memory used to hold
+        if not isinstance(other, (SkuStore, list)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+@dataclass(slots=True, eq=False, repr=False)
+class _CatStore:
+    """
+    Feature vectors of every product seen in one category, stored
+    column-wise (one row per observation) so the whole category can be
+    scanned for similar products with a single NumPy call.
+
+    Appended rows wait in Python lists and are written to the columns in
+    one go when something reads them, so eval_product on a remembered SKU
+    does not pay for NumPy scalar writes it may never scan.
+    """
+
+    _features: np.ndarray  # (capacity, D) int8, see _fit_features
+    _sku_ids: np.ndarray  # (capacity,) int32, interned SKU id of each row
+    _ranks: np.ndarray  # (capacity,) int32, SkuStore.rank of each row, for ties
+    _feature_sums: np.ndarray  # (capacity,) int64, for similarity pruning
+    # (capacity,) uint64 rows packed one byte per dimension, or None once
+    # the category holds a vector that does not fit (see pack_range)
+    _packed: np.ndarray | None
+    dims: int
+    # The owning Customer's SKU intern table, shared across categories
+    sku_intern: dict[str, int] = field(repr=False)
+    sku_names: list[str] = field(repr=False)
+    _flushed: int = 0  # rows already in the columns
+    # Rows not yet in the columns, with the min and max of their features
+    _pending: list[tuple[list[int], int, int, int]] = field(default_factory=list)
+    _pending_lo: int = 0
+    _pending_hi: int = 0
+    stores: dict[int, SkuStore] = field(default_factory=dict)
+
+    @classmethod
+    def empty(
+        cls,
+        dims: int,
+        sku_intern: dict[str, int],
+        sku_names: list[str],
+        capacity: int = 8,
+    ) -> "_CatStore":
+        return cls(
+            _features=np.empty((capacity, dims), dtype=np.int8),
+            _sku_ids=np.empty(capacity, dtype=np.int32),
+            _ranks=np.empty(capacity, dtype=np.int32),
+            _feature_sums=np.empty(capacity, dtype=np.int64),
+            _packed=np.empty(capacity, dtype=np.uint64) if dims <= PACK_DIMS else None,
+            dims=dims,
+            sku_intern=sku_intern,
+            sku_names=sku_names,
+        )
+
+    @property
+    def size(self) -> int:
+        return self._flushed + len(self._pending)
+
+    @property
+    def features(self) -> np.ndarray:
+        self._flush()
+        return self._features
+
+    @property
+    def sku_ids(self) -> np.ndarray:
+        self._flush()
+        return self._sku_ids
+
+    @property
+    def ranks(self) -> np.ndarray:
+        self._flush()
+        return self._ranks
+
+    @property
+    def feature_sums(self) -> np.ndarray:
+        self._flush()
+        return self._feature_sums
+
+    @property
+    def packed(self) -> np.ndarray | None:
+        self._flush()
+        return self._packed
+
+    def append(
+        self, store: SkuStore, features: list[int], lo: int, hi: int, total: int
+    ) -> None:
+        # features, their min, max and sum come from _checked_features
+        if self._pending:
+            lo, hi = min(lo, self._pending_lo), max(hi, self._pending_hi)
+        self._pending_lo, self._pending_hi = lo, hi
+        self._pending.append((features, store.sid, store.rank, total))
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        start, stop = self._flushed, self.size
+        # Grow by doubling, like list
+        if stop > len(self._sku_ids):
+            capacity = max(2 * len(self._sku_ids), stop)
+            self._features = _grow(self._features, capacity)
+            self._sku_ids = _grow(self._sku_ids, capacity)
+            self._ranks = _grow(self._ranks, capacity)
+            self._feature_sums = _grow(self._feature_sums, capacity)
+            if self._packed is not None:
+                self._packed = _grow(self._packed, capacity)
+
+        rows, sids, ranks, totals = zip(*self._pending)
+        lo, hi = self._pending_lo, self._pending_hi
+        self._features = _fit_features(self._features, lo, hi)
+        self._features[start:stop] = rows
+        self._sku_ids[start:stop] = sids
+        self._ranks[start:stop] = ranks
+        self._feature_sums[start:stop] = totals
+        if self._packed is not None:
+            packed = pack_block(self._features[start:stop], lo, hi)
+            if packed is None:
+                self._packed = None
+            else:
+                self._packed[start:stop] = packed
+        self._pending.clear()
+        self._flushed = stop
+
+    def get(self, sku: str, default: SkuStore | None = None) -> SkuStore | None:
+        sid = self.sku_intern.get(sku)
+        if sid is None:
+            return default
+        return self.stores.get(sid, default)
+
+    def __getitem__(self, sku: str) -> SkuStore:
+        return self.stores[self.sku_intern[sku]]
+
+    def __contains__(self, sku: str) -> bool:
+        return self.sku_intern.get(sku) in self.stores
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.sku_names[sid] for sid in self.stores)
+
+    def __len__(self) -> int:
+        return len(self.stores)
+
+    def __eq__(self, other: object) -> bool:
+        # Same SKUs with the same histories, regardless of interned ids; a
+        # plain {sku: history} mapping compares by content too
+        if not isinstance(other, (_CatStore, Mapping)):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            sku in other and self[sku] == other[sku] for sku in self
+        )
+
+    def __repr__(self) -> str:
+        return repr({sku: self[sku] for sku in self})
+
+
+@dataclass(slots=True, repr=False)
 class Customer:
 
     preferences: list[int]
     max_distance: float
-    memory: dict[int, dict[str, list[tuple[float, list[float]]]]] = field(
-        default_factory=dict
+    # Keyword-only: memory used to be the third positional field, so an
+    # old Customer(prefs, dist, {}) call must fail instead of shifting
+    price_sensitivty: float = field(default=1.0, kw_only=True)
+    # Everything below derives from _cat or caches lookups into it, and
+    # interned ids depend on sighting order, so only _cat takes part in ==
+    # SKU string -> small int id, assigned in order of first sighting
+    _sku_intern: dict[str, int] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _sku_names: list[str] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+    # (category, sku id) -> remembered prices, the direct-match fast path
+    _sku: dict[tuple[int, int], SkuStore] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    # category -> feature rows of every product seen in it, for similarity
+    _cat: dict[int, _CatStore] = field(default_factory=dict, init=False, repr=False)
+    # Most recent direct match; SkuStores are updated in place on append,
+    # so the cached store never goes stale
+    _last_cat: int | None = field(default=None, init=False, repr=False, compare=False)
+    _last_sku: str | None = field(default=None, init=False, repr=False, compare=False)
+    _last_mem: SkuStore | None = field(
+        default=None, init=False, repr=False, compare=False
     )
-    price_sensitivty: float = 1.0
 
-    def l1_distance(self, item_1: list[int], item_2: list[int]):
+    @property
+    def memory(self) -> Mapping[int, _CatStore]:
+        # Read-only, so memory cannot be emptied without the indexes above
+        return MappingProxyType(self._cat)
+
+    @memory.setter
+    def memory(self, memory: Mapping[int, Any]) -> None:
+        # customer.memory = {} still resets, as it did when memory was a field
+        if memory:
+            raise ValueError(
+                "memory can only be reset to empty; fill it with append_memory"
+            )
+        self.clear_memory()
+
+    def clear_memory(self) -> None:
+        """Forget every remembered product."""
+        self._cat.clear()
+        # Fresh intern tables; dropped stores keep the ones they share
+        self._sku_intern = {}
+        self._sku_names = []
+        self._sku = {}
+        self._last_cat = self._last_sku = self._last_mem = None
+
+    def __repr__(self) -> str:
+        # Same shape as when memory was a constructor field
+        return (
+            f"Customer(preferences={self.preferences!r}, "
+            f"max_distance={self.max_distance!r}, memory={self._cat!r}, "
+            f"price_sensitivty={self.price_sensitivty!r})"
+        )
 
-        distance = sum(abs(pf - sp) for pf, sp in zip(item_1, item_2))
+    def l1_distance(self, item_1: list[int], item_2: list[int]) -> float:
+        # Any, so compiled code accepts floats and NumPy scalars like Python
+        pairs: Iterator[tuple[Any, Any]] = zip(item_1, item_2)
+        distance = sum(abs(pf - sp) for pf, sp in pairs)
         return 1.0 - (distance / self.max_distance)
 
-    def append_memory(self, product: Product):
-        # 1. Check if category exists, if not create it
-        if product.category not in self.memory:
-            self.memory[product.category] = {}
-
-        # 2. Check if SKU exists in that category, if not create list
-        if product.sku not in self.memory[product.category]:
-            self.memory[product.category][product.sku] = []
-
-        # 3. Append new price and features
-        self.memory[product.category][product.sku].append(
-            (product.price, product.features)
-        )
+    def _l1_rows(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        # One query against stacked (N, D) rows; single pairs stay on the
+        # scalar l1_distance, which beats NumPy's call overhead at small D
+        distance = np.abs(rows - query).sum(axis=-1)
+        return 1.0 - (distance / self.max_distance)
 
-    def access_memory(self, product: Product):
+    def append_memory(self, product: Product) -> None:
+        self._append_checked(product, self._check_append(product))
+
+    def _check_append(self, product: Product) -> tuple[list[int], int, int, int]:
+        # Everything that can reject product, before memory is touched
+        checked = _checked_features(product)
+        mem_1 = self._cat.get(product.category)
+        if mem_1 is not None:
+            self._check_dims(product, mem_1)
+        return checked
+
+    def _append_checked(
+        self, product: Product, checked: tuple[list[int], int, int, int]
+    ) -> None:
+        features, lo, hi, total = checked
+        mem_1 = self._cat.get(product.category)
+
+        # eval_product has usually just looked this SKU up
+        store = self._last_hit(product)
+        if store is not None and mem_1 is not None:
+            store.append(price=product.price, row=mem_1.size)
+            mem_1.append(store=store, features=features, lo=lo, hi=hi, total=total)
+            return
+
+        # 1. Intern the SKU
+        sid = self._sku_intern.setdefault(product.sku, len(self._sku_names))
+        if sid == len(self._sku_names):
+            self._sku_names.append(product.sku)
+
+        # 2. Check if category exists, if not create it
+        if mem_1 is None:
+            mem_1 = self._cat[product.category] = _CatStore.empty(
+                dims=len(product.features),
+                sku_intern=self._sku_intern,
+                sku_names=self._sku_names,
+            )
+
+        # 3. Check if SKU exists in that category, if not create its store
+        store = self._sku.get((product.category, sid))
+        if store is None:
+            store = self._sku[(product.category, sid)] = SkuStore.empty(
+                category=mem_1, sid=sid, rank=len(mem_1.stores)
+            )
+            mem_1.stores[sid] = store
+
+        # 4. Append new price and features
+        store.append(price=product.price, row=mem_1.size)
+        mem_1.append(store=store, features=features, lo=lo, hi=hi, total=total)
+
+    @staticmethod
+    def _check_dims(product: Product, mem_1: _CatStore) -> None:
+        # Memory is stored as fixed-width rows per category
+        dims = mem_1.dims
+        if len(product.features) != dims:
+            raise ValueError(
+                f"Product {product.sku!r} has {len(product.features)} features, "
+                f"but category {product.category} stores {dims}"
+            )
+
+    def _last_hit(self, product: Product) -> SkuStore | None:
+        # Same SKU as the last direct match: skip hashing altogether
+        if product.category == self._last_cat and (
+            product.sku is self._last_sku or product.sku == self._last_sku
+        ):
+            return self._last_mem
+        return None
 
-        mem_1 = self.memory.get(product.category, {})
-        if mem_1.get(product.sku):
-            return mem_1.get(product.sku)
-        elif mem_1:
-            return self.memory_refrence(product, mem_1)
-        else:
+    def access_memory(self, product: Product) -> SkuStore | None:
+
+        store = self._last_hit(product)
+        if store is not None:
+            return store
+
+        sid = self._sku_intern.get(product.sku)
+        if sid is not None:
+            store = self._sku.get((product.category, sid))
+        if store is not None:
+            self._last_cat, self._last_sku, self._last_mem = (
+                product.category,
+                product.sku,
+                store,
+            )
+            return store
+
+        mem_1 = self._cat.get(product.category)
+        if mem_1 is None:
             # We will default to value-based scoring
             return None
+        return self.memory_refrence(product, mem_1)
 
     def memory_refrence(
         self,
         product: Product,
-        mem_1: dict,
-        similarity_pct: float = 0.8,
-    ):
-        best_similarity = float("-inf")  # Looking for highest similarity
-        best_sku = None
-
-        for sku, refs in mem_1.items():
-            for _, feature_list in refs:
-                # Calculate similarity score (higher = more similar)
-                similarity = self.l1_distance(
-                    item_1=product.features, item_2=feature_list
+        # Of plain dicts, only the empty one from memory.get(category, {})
+        mem_1: "_CatStore | dict[str, Any]",
+        similarity_pct: float = _SIMILARITY_PCT,
+    ) -> SkuStore | None:
+        if not isinstance(mem_1, _CatStore):
+            if mem_1:
+                raise TypeError(
+                    f"memory_refrence takes a category from customer.memory, "
+                    f"not {type(mem_1).__name__}"
+                )
+            return None
+        if not mem_1:
+            return None
+        self._check_dims(product, mem_1)
+
+        features, lo, hi, _ = _checked_features(product)
+        packed = pack_range(features, lo, hi) if mem_1.packed is not None else None
+        if (
+            packed is not None
+            and mem_1.packed is not None
+            and mem_1.size <= _TILE
+            and self.max_distance > 0
+        ):
+            # Short vectors of small features in a small category: one
+            # kernel call finds the nearest row (highest similarity, as
+            # max_distance is positive) and breaks ties like _first_sku
+            n = mem_1.size
+            idx, distance = nearest_packed(
+                np.uint64(packed), mem_1.packed[:n], mem_1.ranks[:n]
+            )
+            best_similarity = 1.0 - (distance / self.max_distance)
+        else:
+            query = np.asarray(
+                features,
+                dtype=_query_dtype(_fitting_dtype(lo, hi), mem_1.features.dtype),
+            )
+            query_packed = None if packed is None else np.uint64(packed)
+            if mem_1.size <= _TILE:
+                # Similarity against every stored feature vector in one pass
+                sims = self._row_similarity(
+                    query, query_packed, mem_1, slice(0, mem_1.size)
+                )
+                best_similarity = sims.max()
+                idx = self._first_sku(mem_1, np.flatnonzero(sims == best_similarity))
+            else:
+                idx, best_similarity = self._pruned_match(
+                    query, query_packed, mem_1, similarity_pct
                 )
 
-                # Track the best match within threshold (higher similarity is better)
-                if similarity >= similarity_pct and similarity > best_similarity:
-                    best_similarity = similarity
-                    best_sku = sku
-
-        # Return the full memory entry for the most similar product
-        if best_sku is not None:
-            return mem_1[best_sku]
+        if best_similarity >= similarity_pct:
+            # Return the full memory entry for the most similar product
+            return mem_1.stores[int(mem_1.sku_ids[idx])]
 
         return None
 
-    def price_refrence(self, prices: list):
-        price_ref = statistics.median(prices)
-        # Get the absolute deviation
-        abs_devs = [abs(x - price_ref) for x in prices]
-        # Compute MAD
-        mad = statistics.median(abs_devs)
-        # Create relative uncertainty
-        rel_uncert = mad / price_ref
+    def _row_similarity(
+        self,
+        query: np.ndarray,
+        query_packed: np.uint64 | None,
+        mem_1: _CatStore,
+        rows: slice | np.ndarray,
+    ) -> np.ndarray:
+        if query_packed is not None and mem_1.packed is not None:
+            # Short vectors of small features: one uint64 per row
+            distance = l1_packed(query_packed, mem_1.packed[rows])
+            return 1.0 - (distance / self.max_distance)
+        return self._l1_rows(query, mem_1.features[rows])
+
+    def _first_sku(self, mem_1: _CatStore, tied: np.ndarray) -> int:
+        # Ties go to the SKU seen first in the category, like the
+        # SKU-by-SKU scan of the nested dict memory did
+        return int(tied[np.argmin(mem_1.ranks[tied])])
+
+    def _pruned_match(
+        self,
+        query: np.ndarray,
+        query_packed: np.uint64 | None,
+        mem_1: _CatStore,
+        similarity_pct: float,
+    ) -> tuple[int, float]:
+        """
+        Best match for large categories, scanning in tiles of _TILE rows.
+
+        |sum(v) - sum(q)| is a lower bound on the L1 distance, so it gives an
+        upper bound on similarity: rows that cannot reach similarity_pct are
+        skipped, the rest are visited best-bound first, and the scan stops
+        once no remaining row can beat the best match found so far.
+        """
+        n = mem_1.size
+        bounds = self._l1_rows(
+            query.sum(dtype=np.int64)[None], mem_1.feature_sums[:n, None]
+        )
+        candidates = np.flatnonzero(bounds >= similarity_pct)
+        order = candidates[np.argsort(-bounds[candidates], kind="stable")]
+
+        best_idx, best_similarity = -1, float("-inf")
+        for start in range(0, len(order), _TILE):
+            tile = order[start : start + _TILE]
+            if bounds[tile[0]] < best_similarity:
+                break
+            sims = self._row_similarity(query, query_packed, mem_1, tile)
+            tile_best = sims.max()
+            idx = self._first_sku(mem_1, tile[sims == tile_best])
+            if tile_best > best_similarity or (
+                tile_best == best_similarity
+                and mem_1.ranks[idx] < mem_1.ranks[best_idx]
+            ):
+                best_idx, best_similarity = idx, tile_best
+
+        return best_idx, best_similarity
+
+    def price_refrence(self, prices: np.ndarray | list[float]) -> tuple[float, float]:
+        price_ref, _, rel_uncert = _price_stats(sorted(float(p) for p in prices))
         return price_ref, rel_uncert
 
     def eval_product(
         self, product: Product, chart: bool = False, update_mem: bool = True
-    ):
+    ) -> float:
         """
         Evaluate a product and return a score.
 
@@ -101,62 +676,238 @@ class Customer:
         """
         value = self.l1_distance(item_1=product.features, item_2=self.preferences)
         mem_1 = self.access_memory(product)
-        score = self.score(mem_1=mem_1, product=product, value=value, chart=chart)
+        score = self.score(mem_1=mem_1, price=product.price, value=value)
+
+        # Charts need a reference price, like the score itself
+        if chart and mem_1:
+            from plotting import plot_customer_position
+
+            ref, _, rel_uncert = mem_1.price_stats()
+            wtp = willingness_to_pay(ref, value, self.price_sensitivty)
+            plot_customer_position(self, product, score, ref, wtp, value, rel_uncert)
 
         # Add to memory
         if update_mem:
             self.append_memory(product=product)
         return score
 
-    def score(self, mem_1: dict, product: Product, value: float, chart: bool = False):
+    def eval_products_batch(
+        self,
+        features: np.ndarray,
+        prices: np.ndarray,
+        skus: np.ndarray,
+        categories: np.ndarray,
+        update_mem: bool = True,
+    ) -> np.ndarray:
+        """
+        Evaluate many products at once and return an array of scores.
+
+        Every row is scored against memory as it was before the batch;
+        with update_mem=True the products are appended afterwards, in order,
+        once all of them have been checked, so a ValueError leaves memory
+        untouched.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        n = len(prices)
+        if n == 0:
+            return np.empty(0)
+        features = np.asarray(features).reshape(n, -1)
+        skus = np.asarray(skus)
+        categories = np.asarray(categories)
+        # Keep callers' full integer range; memory narrows rows on append
+        features = self._checked_batch_features(features, skus)
+
+        # Only the leading columns both have count, as l1_distance zips them
+        dims = min(features.shape[1], len(self.preferences))
+        values = self._l1_rows(np.asarray(self.preferences[:dims]), features[:, :dims])
+        scores = values * 100  # rows without a reference score on value alone
+
+        refs = np.zeros(n)
+        uncerts = np.zeros(n)
+        hits = self._batch_direct(skus, categories, refs, uncerts)
+        has_ref = hits.copy()
+
+        # Everything else is matched by similarity, one scan per category
+        for category in np.unique(categories[~hits]).tolist():
+            mem_1 = self._cat.get(category)
+            if not mem_1:
+                continue
+            rows = np.flatnonzero(~hits & (categories == category))
+            self._batch_similar(
+                category, mem_1, rows, features, skus, refs, uncerts, has_ref
+            )
+
+        scores[has_ref] = score_core_rows(
+            prices[has_ref],
+            refs[has_ref],
+            uncerts[has_ref],
+            values[has_ref],
+            float(self.price_sensitivty),
+        )
+
+        # Add to memory, once every row is known to be accepted
+        if update_mem:
+            products = [
+                self._batch_product(i, features, prices, skus, categories)
+                for i in range(n)
+            ]
+            checked = [self._check_append(product) for product in products]
+            for product, row in zip(products, checked):
+                self._append_checked(product, row)
+        return scores
+
+    def _batch_direct(
+        self,
+        skus: np.ndarray,
+        categories: np.ndarray,
+        refs: np.ndarray,
+        uncerts: np.ndarray,
+    ) -> np.ndarray:
+        # Direct SKU matches, one lookup per distinct (category, sku);
+        # fills refs and uncerts and returns the mask of matched rows
+        sku_names, sku_codes = np.unique(skus, return_inverse=True)
+        _, cat_codes = np.unique(categories, return_inverse=True)
+        pairs = cat_codes.reshape(-1) * len(sku_names) + sku_codes.reshape(-1)
+        _, first, pair_of_row = np.unique(pairs, return_index=True, return_inverse=True)
+        pair_of_row = pair_of_row.reshape(-1)
+
+        pair_refs = np.zeros(len(first))
+        pair_uncerts = np.zeros(len(first))
+        pair_hits = np.zeros(len(first), dtype=bool)
+        for pair, i in enumerate(first.tolist()):
+            sid = self._sku_intern.get(str(skus[i]))
+            if sid is None:
+                continue
+            store = self._sku.get((int(categories[i]), sid))
+            if store:
+                pair_refs[pair], _, pair_uncerts[pair] = store.price_stats()
+                pair_hits[pair] = True
+
+        hits = pair_hits[pair_of_row]
+        refs[hits] = pair_refs[pair_of_row[hits]]
+        uncerts[hits] = pair_uncerts[pair_of_row[hits]]
+        return hits
+
+    def _batch_similar(
+        self,
+        category: int,
+        mem_1: _CatStore,
+        rows: np.ndarray,
+        features: np.ndarray,
+        skus: np.ndarray,
+        refs: np.ndarray,
+        uncerts: np.ndarray,
+        has_ref: np.ndarray,
+    ) -> None:
+        """
+        memory_refrence for many rows of one category at once.
+
+        Each distinct feature vector is compared with every stored row in
+        one broadcast, in blocks of queries sized by _BATCH_CELLS; the best
+        match and its tie-break are the ones memory_refrence would pick.
+        """
+        stored_dims = mem_1.features.shape[1]
+        if features.shape[1] != stored_dims:
+            i = int(rows[0])
+            raise ValueError(
+                f"Product {str(skus[i])!r} (row {i}) has {features.shape[1]} "
+                f"features, but category {category} stores {stored_dims}"
+            )
+
+        queries, query_of_row = np.unique(
+            features[rows], axis=0, return_inverse=True
+        )
+        n = mem_1.size
+        stored = mem_1.features[:n].astype(np.int64)
+        ranks = mem_1.ranks[:n]
+        best_rows = np.empty(len(queries), dtype=np.int64)
+        best_sims = np.empty(len(queries))
+        block = max(1, _BATCH_CELLS // max(1, stored.size))
+        for start in range(0, len(queries), block):
+            sims = self._l1_rows(
+                queries[start : start + block, None, :], stored[None, :, :]
+            )
+            best = sims.max(axis=1)
+            # Ties go to the SKU seen first in the category, like _first_sku
+            tied_ranks = np.where(sims == best[:, None], ranks, np.iinfo(np.int32).max)
+            best_rows[start : start + block] = tied_ranks.argmin(axis=1)
+            best_sims[start : start + block] = best
+
+        # Price stats once per matched SKU
+        matched = best_sims >= _SIMILARITY_PCT
+        sids = mem_1.sku_ids[best_rows[matched]]
+        query_refs = np.zeros(len(queries))
+        query_uncerts = np.zeros(len(queries))
+        stats = {
+            sid: mem_1.stores[sid].price_stats() for sid in np.unique(sids).tolist()
+        }
+        query_refs[matched] = [stats[sid][0] for sid in sids.tolist()]
+        query_uncerts[matched] = [stats[sid][2] for sid in sids.tolist()]
+
+        query_of_row = query_of_row.reshape(-1)
+        refs[rows] = query_refs[query_of_row]
+        uncerts[rows] = query_uncerts[query_of_row]
+        has_ref[rows] = matched[query_of_row]
+
+    @staticmethod
+    def _checked_batch_features(features: np.ndarray, skus: np.ndarray) -> np.ndarray:
+        # Same rules as _checked_features, checked before the int64 cast
+        # can truncate or wrap
+        if features.dtype.kind == "f":
+            bad_rows = ~np.isfinite(features) | (features != np.trunc(features))
+            bad = np.flatnonzero(bad_rows.any(axis=1))
+            if len(bad):
+                i = int(bad[0])
+                raise ValueError(
+                    f"Product {str(skus[i])!r} (row {i}) has non-integer "
+                    f"features {features[i].tolist()}, "
+                    f"but memory stores integer features"
+                )
+        bound = _feature_bound(features.shape[1])
+        if features.dtype.kind in "fu":
+            # Anything this large is out of bounds anyway; the cast is exact below it
+            too_wide = np.abs(features) >= _FEATURE_LIMIT
+        else:
+            too_wide = np.zeros(features.shape, dtype=bool)
+        ints = np.where(too_wide, 0, features).astype(np.int64)
+        too_wide |= (ints >= bound) | (ints <= -bound)
+        bad = np.flatnonzero(too_wide.any(axis=1))
+        if len(bad):
+            i = int(bad[0])
+            raise ValueError(
+                f"Product {str(skus[i])!r} (row {i}) has features "
+                f"{features[i].tolist()}, but memory stores features below "
+                f"{bound} in magnitude, so their int64 distances cannot wrap"
+            )
+        return ints
+
+    @staticmethod
+    def _batch_product(
+        i: int,
+        features: np.ndarray,
+        prices: np.ndarray,
+        skus: np.ndarray,
+        categories: np.ndarray,
+    ) -> Product:
+        return Product(
+            price=float(prices[i]),
+            sku=str(skus[i]),
+            category=int(categories[i]),
+            features=features[i].tolist(),
+        )
+
+    def score(self, mem_1: SkuStore | None, price: float, value: float) -> float:
         # No reference price available - score purely on value match
         if mem_1 is None or len(mem_1) == 0:
             final_score = value * 100  # 0-100 based on feature match
             return final_score
 
         # Check price reference from memory
-        # Return median and relative uncertainty (mad / median)
-        ref, rel_uncert = self.price_refrence([price for price, _ in mem_1])
-
-        # Calibrate baseline so that product with value 0.5
-        # is worth reference price
-        if value <= 0.5:
-            wtp = ref * (value * 2.0)
-        else:
-            max_premium = 0.6 / self.price_sensitivty
-            wtp = ref * (1.0 + max_premium * (value - 0.5))
-
-        # Get the percentage difference
-        rel_delta = (wtp - product.price) / wtp
-
-        # If rel_delta between wtp and price is within
-        # the relative uncertainty we consider it to
-        # be equal to the market price.
-        if abs(rel_delta) < rel_uncert:
-            rel_delta = 0
-
-        if rel_delta >= 0:
-            # If delta is positive (better price)
-            # We create a positive feeling with diminishing returns
-            feeling = rel_delta**0.65
-        else:
-            # If delta is negative (worse price)
-            # We create a negative feeling with diminishing returns
-            # loss aversion: overpriced hurts ~2x
-            feeling = -2 * ((-rel_delta) ** 0.65)
-
-        k_eff = 6.0 * self.price_sensitivty
-
-        # Use sigmoid to determine score
-        score = 100.0 / (1.0 + math.exp(-k_eff * feeling))
-        final_score = max(0.0, min(100.0, score))
-
-        if chart:
-            from plotting import plot_customer_position
-
-            plot_customer_position(self, product, final_score, ref, wtp, value, rel_uncert)
+        # Return median and relative uncertainty (mad / median),
+        # memoized per SKU until its next price is appended
+        ref, _, rel_uncert = mem_1.price_stats()
 
-        return final_score
+        return score_core(ref, rel_uncert, value, price, self.price_sensitivty)
 
 
 if __name__ == "__main__":
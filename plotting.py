@@ -2,7 +2,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from pathlib import Path
 import shutil
-from model import Product
+from kernels import score_core_vec
 
 
 def clear_charts_folder():
@@ -24,22 +24,12 @@ def plot_customer_position(customer, product, current_score, ref_price, wtp, val
 
     # Generate price range around reference price
     prices = np.linspace(ref_price * 0.5, ref_price * 2.0, 100)
-    scores = []
-
-    # Calculate scores across price range
-    for price in prices:
-        test_product = Product(
-            price=float(price),
-            sku=product.sku,
-            category=product.category,
-            features=product.features,
-        )
-        mem_1 = customer.access_memory(test_product)
-        value = customer.l1_distance(
-            item_1=test_product.features, item_2=customer.preferences
-        )
-        s = customer.score(mem_1=mem_1, product=test_product, value=value, chart=False)
-        scores.append(s)
+
+    # Only price varies along the curve: reference, uncertainty and value
+    # are fixed, so the whole sweep is scored in one kernel call
+    scores = score_core_vec(
+        prices, ref_price, rel_uncert, value, customer.price_sensitivty
+    )
 
     plt.figure(figsize=(12, 8))
 
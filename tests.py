@@ -1,4 +1,17 @@
+import dataclasses
+import statistics
+
+import numpy as np
 import pytest
+from kernels import (
+    fast_sigmoid,
+    l1_packed,
+    nearest_packed,
+    pack_block,
+    pack_features,
+    score_core,
+    score_core_vec,
+)
 from model import Customer, Product
 
 
@@ -26,6 +39,117 @@ def different_category_product():
     return Product(price=120, sku="other_item", category=2, features=[5, 5, 5])
 
 
+class TestProduct:
+    """Tests for the Product record"""
+
+    def test_product_is_frozen(self, ref_product):
+        """Products should be immutable and carry no per-instance __dict__"""
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            ref_product.price = 1
+
+        assert not hasattr(ref_product, "__dict__")
+
+
+class TestCustomer:
+    """Tests for the Customer parameters"""
+
+    def test_max_distance_can_change(self, customer):
+        """Similarity should follow max_distance after it is reassigned"""
+        assert customer.l1_distance([0, 0, 0], [27, 0, 0]) == pytest.approx(0.0)
+
+        customer.max_distance = 54
+
+        assert customer.l1_distance([0, 0, 0], [27, 0, 0]) == pytest.approx(0.5)
+
+    def test_equal_memory_compares_equal(self):
+        """Customers that remember the same products should compare equal"""
+        customer_1 = Customer(preferences=[5, 5, 5], max_distance=27)
+        customer_2 = Customer(preferences=[5, 5, 5], max_distance=27)
+        mars = Product(price=1.0, sku="mars", category=1, features=[5, 5, 5])
+        twix = Product(price=1.2, sku="twix", category=2, features=[4, 5, 5])
+
+        customer_1.append_memory(mars)
+        customer_1.append_memory(twix)
+        customer_2.append_memory(twix)
+        customer_2.append_memory(mars)
+
+        assert customer_1 == customer_2
+
+        customer_2.append_memory(mars)
+
+        assert customer_1 != customer_2
+
+    def test_memory_equals_plain_containers(self, customer, ref_product):
+        """Memory should compare by content with the plain dicts and lists it used to be"""
+        customer.append_memory(ref_product)
+
+        assert customer.memory[1]["ref_item"] == [(100, [5, 5, 5])]
+        assert customer.memory[1] == {"ref_item": [(100, [5, 5, 5])]}
+        assert customer.memory == {1: {"ref_item": [(100, [5, 5, 5])]}}
+        assert customer.memory != {1: {"ref_item": [(100, [5, 5, 4])]}}
+        assert customer.memory[1] != {"other": [(100, [5, 5, 5])]}
+
+    def test_repr_shows_memory(self):
+        """repr should include memory as nested category -> SKU -> history"""
+        customer = Customer(preferences=[5, 5, 5], max_distance=27.0)
+        customer.append_memory(
+            Product(price=1.0, sku="mars", category=1, features=[5, 5, 5])
+        )
+
+        assert repr(customer) == (
+            "Customer(preferences=[5, 5, 5], max_distance=27.0, "
+            "memory={1: {'mars': [(1.0, [5, 5, 5])]}}, price_sensitivty=1.0)"
+        )
+
+    def test_memory_is_read_only(self, customer, ref_product):
+        """The memory view should not allow changes behind the customer's back"""
+        customer.append_memory(ref_product)
+
+        with pytest.raises(AttributeError):
+            customer.memory.clear()
+        with pytest.raises(TypeError):
+            customer.memory[2] = {}
+
+    @pytest.mark.parametrize("reset", ["clear_memory", "assign_empty"])
+    def test_reset_memory(self, customer, ref_product, reset):
+        """Resetting should forget every product, including cached lookups"""
+        customer.eval_product(ref_product)
+        if reset == "clear_memory":
+            customer.clear_memory()
+        else:
+            customer.memory = {}
+
+        assert customer.memory == {}
+        assert customer.access_memory(ref_product) is None
+
+        customer.append_memory(ref_product)
+
+        assert list(customer.memory[1]["ref_item"]) == [(100, [5, 5, 5])]
+
+    def test_memory_reset_only_to_empty(self, customer):
+        """Assigning a non-empty memory should raise rather than be ignored"""
+        with pytest.raises(ValueError, match="append_memory"):
+            customer.memory = {1: {}}
+
+    def test_old_positional_memory_rejected(self):
+        """A memory dict in the old third position should not become price_sensitivty"""
+        with pytest.raises(TypeError):
+            Customer([5, 5, 5], 27, {})
+
+    def test_l1_distance_of_single_pair(self, customer):
+        """A single pair should return a plain float, zipping like the original"""
+        value = customer.l1_distance([5, 5, 5], [2, 5, 5, 9])
+
+        assert type(value) is float
+        assert value == pytest.approx(1 - 3 / 27)
+
+    def test_l1_distance_of_non_int_features(self, customer):
+        """Floats and NumPy integers should be accepted, also when compiled with mypyc"""
+        value = customer.l1_distance([5.0, 5.0, 5.0], [np.int64(2), 5, 5])
+
+        assert value == pytest.approx(1 - 3 / 27)
+
+
 class TestMemoryAccess:
     """Tests for the memory access functionality"""
 
@@ -109,6 +233,37 @@ class TestMemoryAccess:
         assert result is not None
         assert result[0][0] == expected_price
 
+    def test_repeat_lookup_sees_new_prices(self, customer, ref_product):
+        """Repeated lookups of the same SKU should reflect prices appended in between"""
+        customer.append_memory(ref_product)
+        assert len(customer.access_memory(ref_product)) == 1
+
+        customer.append_memory(Product(price=120, sku="ref_item", category=1, features=[5, 5, 5]))
+        result = customer.access_memory(ref_product)
+
+        assert [price for price, _ in result] == [100, 120]
+
+    def test_repeat_lookup_other_category(self, customer, ref_product):
+        """The last-hit cache should not leak across categories with the same SKU"""
+        customer.append_memory(ref_product)
+        customer.access_memory(ref_product)
+
+        other = Product(price=100, sku="ref_item", category=2, features=[5, 5, 5])
+
+        assert customer.access_memory(other) is None
+
+    def test_eval_product_appends_to_looked_up_sku(self, customer, ref_product):
+        """Appending right after a lookup should extend that SKU and its category"""
+        customer.append_memory(ref_product)
+
+        customer.eval_product(Product(price=120, sku="ref_item", category=1, features=[5, 5, 6]))
+        customer.eval_product(Product(price=130, sku="ref_item", category=2, features=[5, 5, 5]))
+
+        assert [price for price, _ in customer.memory[1]["ref_item"]] == [100, 120]
+        assert customer.memory[1].size == 2
+        assert customer.memory[1].features[1].tolist() == [5, 5, 6]
+        assert len(customer.memory[2]["ref_item"]) == 1
+
 
 class TestMemoryAppend:
     """Tests for appending products to memory"""
@@ -143,6 +298,25 @@ class TestMemoryAppend:
         assert customer.memory[1]["item1"][0] == (100, [5, 5, 5])
         assert customer.memory[1]["item1"][1] == (110, [5, 5, 6])
 
+    def test_feature_length_must_match_category(self, customer, ref_product):
+        """Products in one category should share a feature length"""
+        customer.append_memory(ref_product)
+        short = Product(price=100, sku="short", category=1, features=[5, 5])
+
+        with pytest.raises(ValueError, match="has 2 features, but category 1 stores 3"):
+            customer.append_memory(short)
+        with pytest.raises(ValueError, match="has 2 features"):
+            customer.access_memory(short)
+
+        assert customer.memory[1].size == 1
+
+    def test_prices_round_trip(self, customer):
+        """Remembered prices should come back exactly as they were appended"""
+        customer.append_memory(Product(price=19.99, sku="item1", category=1, features=[5, 5, 5]))
+
+        assert customer.memory[1]["item1"][0] == (19.99, [5, 5, 5])
+        assert customer.memory[1]["item1"].price_stats()[0] == 19.99
+
 
 class TestMemoryReference:
     """Tests for the memory_reference function (finding similar products)"""
@@ -174,6 +348,22 @@ class TestMemoryReference:
 
         assert result is None
 
+    def test_empty_category_returns_none(self, customer):
+        """A category missing from memory should give no reference"""
+        query_product = Product(price=120, sku="query", category=1, features=[5, 5, 5])
+
+        result = customer.memory_refrence(query_product, customer.memory.get(1, {}))
+
+        assert result is None
+
+    def test_non_empty_plain_dict_raises(self, customer, ref_product):
+        """A hand-built category dict should raise rather than quietly find nothing"""
+        customer.append_memory(ref_product)
+        mem_1 = {"ref_item": list(customer.memory[1]["ref_item"])}
+
+        with pytest.raises(TypeError, match="customer.memory"):
+            customer.memory_refrence(ref_product, mem_1)
+
     def test_returns_most_similar_product(self, customer):
         """Should return the most similar product when multiple exist"""
         # Add two products with different similarity levels
@@ -194,3 +384,547 @@ class TestMemoryReference:
         assert result is not None
         # Should return close_product (highest similarity = 0.963)
         assert result[0][0] == 100
+
+    def test_new_memory_visible_after_lookup(self, customer):
+        """Products appended after a similarity lookup should be considered next time"""
+        customer.append_memory(Product(price=100, sku="far", category=1, features=[5, 7, 8]))
+
+        query_product = Product(price=120, sku="query", category=1, features=[5, 5, 5])
+        first = customer.memory_refrence(query_product, customer.memory[1])
+        assert first[0][0] == 100
+
+        customer.append_memory(Product(price=90, sku="close", category=1, features=[5, 5, 6]))
+        second = customer.memory_refrence(query_product, customer.memory[1])
+
+        assert second[0][0] == 90
+
+    @pytest.mark.parametrize("seed", [0, 1, 2])
+    def test_pruned_search_matches_brute_force(self, customer, seed):
+        """Large categories should return the same match as a full scan"""
+        rng = np.random.default_rng(seed)
+        rows = rng.integers(0, 10, size=(300, 3)).tolist()
+        for i, features in enumerate(rows):
+            customer.append_memory(Product(price=i, sku=f"item{i}", category=1, features=features))
+
+        for query_features in rng.integers(0, 10, size=(20, 3)).tolist():
+            query_product = Product(price=0, sku="query", category=1, features=query_features)
+            distances = [sum(abs(q - f) for q, f in zip(query_features, row)) for row in rows]
+            best = int(np.argmin(distances))
+
+            result = customer.memory_refrence(query_product, customer.memory[1], similarity_pct=0.8)
+
+            if 1.0 - distances[best] / 27 >= 0.8:
+                assert result[0][0] == best
+            else:
+                assert result is None
+
+    def test_tie_goes_to_first_seen_sku(self, customer):
+        """Equally similar rows should resolve to the SKU seen first in the category"""
+        customer.append_memory(Product(price=100, sku="a", category=1, features=[5, 5, 7]))
+        customer.append_memory(Product(price=200, sku="b", category=1, features=[5, 5, 5]))
+        customer.append_memory(Product(price=110, sku="a", category=1, features=[5, 5, 5]))
+
+        query_product = Product(price=0, sku="query", category=1, features=[5, 5, 4])
+
+        assert customer.access_memory(query_product) is customer.memory[1]["a"]
+
+    def test_tie_goes_to_first_seen_sku_in_large_category(self, customer):
+        """The pruned search should break ties the same way"""
+        for i in range(70):
+            customer.append_memory(Product(price=1, sku=f"far{i}", category=1, features=[9, 9, 9]))
+        customer.append_memory(Product(price=100, sku="a", category=1, features=[5, 5, 7]))
+        customer.append_memory(Product(price=200, sku="b", category=1, features=[5, 5, 5]))
+        customer.append_memory(Product(price=110, sku="a", category=1, features=[5, 5, 5]))
+
+        query_product = Product(price=0, sku="query", category=1, features=[5, 5, 4])
+
+        assert customer.access_memory(query_product) is customer.memory[1]["a"]
+
+
+class TestMemoryStore:
+    """Tests for the column-wise category store"""
+
+    def test_store_grows_past_initial_capacity(self, customer):
+        """Appending more rows than the initial capacity should keep every row"""
+        for i in range(20):
+            customer.append_memory(
+                Product(price=100 + i, sku=f"item{i % 3}", category=1, features=[i % 10, 5, 5])
+            )
+
+        store = customer.memory[1]
+        assert store.size == 20
+        assert len(store) == 3
+        assert [price for price, _ in store["item1"]] == [101 + 3 * i for i in range(7)]
+        assert store["item2"][0] == (102, [2, 5, 5])
+
+    def test_direct_match_returns_sku_store(self, customer, ref_product):
+        """A direct match should return the SKU's store without copying"""
+        customer.append_memory(ref_product)
+
+        assert customer.access_memory(ref_product) is customer.memory[1]["ref_item"]
+
+    def test_sku_ids_shared_across_categories(self, customer):
+        """The same SKU in two categories should share an id but not its prices"""
+        customer.append_memory(Product(price=100, sku="item1", category=1, features=[5, 5, 5]))
+        customer.append_memory(Product(price=200, sku="item1", category=2, features=[5, 5, 5]))
+        customer.append_memory(Product(price=300, sku="item2", category=2, features=[5, 5, 5]))
+
+        assert customer.memory[1].sku_ids[0] == customer.memory[2].sku_ids[0]
+        assert customer.memory[1]["item1"][0][0] == 100
+        assert customer.memory[2]["item1"][0][0] == 200
+        assert "item2" not in customer.memory[1]
+        assert list(customer.memory[2]) == ["item1", "item2"]
+
+    def test_features_stored_as_int8(self, customer, ref_product):
+        """Features should be stored as int8 and widen only when they do not fit"""
+        customer.append_memory(ref_product)
+        assert customer.memory[1].features.dtype == np.int8
+        assert customer.memory[1]["ref_item"].features.dtype == np.int8
+
+        customer.append_memory(Product(price=100, sku="ref_item", category=1, features=[-300, 5, 5]))
+
+        assert customer.memory[1].features.dtype == np.int16
+        assert customer.memory[1]["ref_item"][0] == (100, [5, 5, 5])
+        assert customer.memory[1]["ref_item"][1] == (100, [-300, 5, 5])
+
+    def test_non_integer_features_rejected(self, customer):
+        """Fractional features should raise rather than be truncated"""
+        product = Product(price=100, sku="ref", category=1, features=[0.4, 0.4, 0.4])
+
+        with pytest.raises(ValueError, match="non-integer"):
+            customer.append_memory(product)
+
+        assert 1 not in customer.memory
+
+    @pytest.mark.parametrize("features", [[5.0, 5.0, 5.0], [np.int64(5)] * 3])
+    def test_integral_non_int_features_accepted(self, customer, features):
+        """Whole-number floats and NumPy integers should be stored like ints"""
+        customer.append_memory(Product(price=100, sku="ref", category=1, features=features))
+
+        assert list(customer.memory[1]["ref"]) == [(100, [5, 5, 5])]
+
+    @pytest.mark.parametrize("features", [[2**63, 0, 0], [2**62, 2**62, 0]])
+    def test_features_beyond_int64_leave_memory_intact(self, customer, ref_product, features):
+        """Features too large for int64 distances should raise before memory changes"""
+        customer.append_memory(ref_product)
+
+        with pytest.raises(ValueError, match="int64"):
+            customer.append_memory(Product(price=1.0, sku="b", category=1, features=features))
+
+        assert "b" not in customer.memory[1]
+        customer.append_memory(Product(price=2.0, sku="b", category=1, features=[7, 7, 7]))
+        assert list(customer.memory[1]["b"]) == [(2.0, [7, 7, 7])]
+        assert list(customer.memory[1]["ref_item"]) == [(100, [5, 5, 5])]
+
+    def test_int64_distances_do_not_wrap(self):
+        """Far-apart int64 rows should not look similar through a wrapped distance"""
+        customer = Customer(preferences=[0], max_distance=27)
+
+        with pytest.raises(ValueError, match="cannot wrap"):
+            customer.append_memory(Product(price=1, sku="far", category=1, features=[2**62]))
+
+        customer.append_memory(Product(price=1, sku="far", category=1, features=[2**62 - 1]))
+        query_product = Product(price=1, sku="query", category=1, features=[-(2**62 - 1)])
+
+        assert customer.access_memory(query_product) is None
+        scores = customer.eval_products_batch(
+            features=np.array([query_product.features]),
+            prices=np.array([query_product.price]),
+            skus=np.array([query_product.sku]),
+            categories=np.array([query_product.category]),
+            update_mem=False,
+        )
+        assert scores[0] == pytest.approx(customer.l1_distance([-(2**62 - 1)], [0]) * 100)
+
+    def test_widened_rows_do_not_wrap(self):
+        """Distances between int16 rows and queries should not wrap around"""
+        customer = Customer(preferences=[0, 0, 0], max_distance=100000)
+        customer.append_memory(Product(price=100, sku="low", category=1, features=[-30000, 0, 0]))
+
+        query_product = Product(price=0, sku="high", category=1, features=[30000, 0, 0])
+
+        assert customer.memory[1].features.dtype == np.int16
+        assert customer.access_memory(query_product) is None
+        assert customer.memory_refrence(query_product, customer.memory[1], 0.3) is not None
+
+    def test_features_beyond_int16(self):
+        """Features that do not fit int16 should widen storage and queries"""
+        customer = Customer(preferences=[0, 0, 0], max_distance=100000)
+        customer.append_memory(Product(price=100, sku="small", category=1, features=[5, 0, 0]))
+        customer.append_memory(Product(price=200, sku="big", category=1, features=[40000, 0, 0]))
+
+        query_product = Product(price=0, sku="query", category=1, features=[40001, 0, 0])
+        result = customer.access_memory(query_product)
+
+        assert customer.memory[1].features.dtype == np.int32
+        assert customer.memory[1]["big"][0] == (200, [40000, 0, 0])
+        assert result is customer.memory[1]["big"]
+
+    def test_entry_exposes_arrays(self, customer, ref_product):
+        """Memory entries should expose prices and features as arrays"""
+        customer.append_memory(ref_product)
+
+        entry = customer.access_memory(ref_product)
+
+        assert entry.prices.tolist() == [100]
+        assert entry.features.shape == (1, 3)
+
+
+class TestPackedDistance:
+    """Tests for the packed (one byte per dimension) L1 distance"""
+
+    def test_matches_plain_l1(self):
+        """Packed distances should equal the plain L1 distance"""
+        rng = np.random.default_rng(0)
+        for dims in range(1, 9):
+            rows = rng.integers(0, 128, size=(50, dims))
+            query = rng.integers(0, 128, size=dims)
+
+            packed_rows = np.array([pack_features(r.tolist()) for r in rows])
+            distances = l1_packed(pack_features(query.tolist()), packed_rows)
+
+            assert distances.tolist() == np.abs(rows - query).sum(axis=1).tolist()
+
+    def test_block_packing_matches_rows(self):
+        """Packing a block of rows at once should match packing each row"""
+        rng = np.random.default_rng(2)
+        for dims in range(1, 9):
+            rows = rng.integers(0, 128, size=(20, dims)).astype(np.int8)
+
+            packed = pack_block(rows, int(rows.min()), int(rows.max()))
+
+            assert packed.tolist() == [pack_features(r.tolist()) for r in rows]
+
+    def test_nearest_matches_brute_force(self):
+        """The nearest packed row should be the closest, ties going to the lowest rank"""
+        rng = np.random.default_rng(1)
+        rows = rng.integers(0, 4, size=(40, 3))
+        ranks = rng.integers(0, 10, size=40).astype(np.int32)
+        query = rng.integers(0, 4, size=3)
+
+        packed_rows = np.array([pack_features(r.tolist()) for r in rows])
+        idx, distance = nearest_packed(pack_features(query.tolist()), packed_rows, ranks)
+
+        distances = np.abs(rows - query).sum(axis=1)
+        tied = np.flatnonzero(distances == distances.min())
+        assert distance == distances.min()
+        assert ranks[idx] == ranks[tied].min()
+
+    @pytest.mark.parametrize("features", [[1] * 9, [128, 0, 0], [-1, 5, 5]])
+    def test_unpackable_vectors(self, features):
+        """Vectors that do not fit a byte lane per dimension should not pack"""
+        assert pack_features(features) is None
+
+    def test_unpackable_row_falls_back(self, customer):
+        """A category with an unpackable row should still find matches"""
+        customer.append_memory(Product(price=100, sku="ref", category=1, features=[5, 5, 5]))
+        customer.append_memory(Product(price=110, sku="big", category=1, features=[500, 5, 5]))
+
+        query_product = Product(price=0, sku="query", category=1, features=[5, 5, 6])
+        result = customer.access_memory(query_product)
+
+        assert customer.memory[1].packed is None
+        assert result[0][0] == 100
+
+
+class TestScore:
+    """Tests for the compiled scoring kernels"""
+
+    def test_no_reference_scores_on_value(self, customer):
+        """Without a reference price the score should be the value match"""
+        product = Product(price=100, sku="new_item", category=1, features=[5, 5, 5])
+
+        assert customer.eval_product(product, update_mem=False) == pytest.approx(100.0)
+
+    def test_score_takes_price_directly(self, customer, ref_product):
+        """score should only need the price, matching eval_product"""
+        customer.append_memory(ref_product)
+        mem_1 = customer.access_memory(ref_product)
+        value = customer.l1_distance(item_1=ref_product.features, item_2=customer.preferences)
+
+        score = customer.score(mem_1=mem_1, price=90.0, value=value)
+
+        query = Product(price=90.0, sku="ref_item", category=1, features=[5, 5, 5])
+        assert score == customer.eval_product(query, update_mem=False)
+
+    def test_price_within_tolerance_is_neutral(self):
+        """A price within the relative uncertainty of the WTP should score 50"""
+        assert score_core(1.0, 0.05, 0.5, 1.02, 1.0) == pytest.approx(50.0)
+
+    def test_zero_value_raises(self, customer, ref_product):
+        """Features max_distance away from the preferences leave nothing to pay"""
+        customer.append_memory(ref_product)
+        product = Product(price=90, sku="ref_item", category=1, features=[14, 14, 14])
+
+        with pytest.raises(ValueError, match="willingness to pay"):
+            customer.eval_product(product, update_mem=False)
+
+    def test_negative_value_still_scores(self, ref_product):
+        """Features beyond max_distance give a negative WTP that scores like the baseline"""
+        customer = Customer(preferences=[9, 9, 9], max_distance=10)
+        customer.append_memory(ref_product)
+        product = Product(price=100, sku="ref_item", category=1, features=[0, 0, 0])
+
+        assert customer.l1_distance(product.features, customer.preferences) < 0
+        assert customer.eval_product(product, update_mem=False) == pytest.approx(99.92, abs=0.01)
+
+    def test_zero_reference_price_raises(self, customer):
+        """A remembered price of 0 should not produce a score"""
+        customer.append_memory(Product(price=0, sku="free", category=1, features=[5, 5, 5]))
+        product = Product(price=1, sku="free", category=1, features=[5, 5, 5])
+
+        with pytest.raises(ValueError, match="willingness to pay"):
+            customer.eval_product(product, update_mem=False)
+
+    def test_zero_price_sensitivity_raises(self):
+        """price_sensitivty=0 should raise rather than score on NaN"""
+        with pytest.raises(ValueError, match="price_sensitivty"):
+            score_core(1.0, 0.05, 0.7, 1.0, 0.0)
+
+    def test_fast_sigmoid_close_to_exact(self):
+        """The approximated sigmoid should stay within 1e-4 of the exact one"""
+        for x in np.linspace(-40, 40, 2001):
+            assert fast_sigmoid(x) == pytest.approx(1.0 / (1.0 + np.exp(-x)), abs=1e-4)
+
+    def test_vectorized_matches_scalar(self):
+        """The batch kernel should agree with the scalar kernel"""
+        prices = np.linspace(0.5, 2.0, 25)
+
+        scores = score_core_vec(prices, 1.0, 0.05, 0.7, 1.0)
+
+        expected = [score_core(1.0, 0.05, 0.7, p, 1.0) for p in prices]
+        assert scores == pytest.approx(expected)
+
+
+class TestBatchEval:
+    """Tests for scoring many products in one call"""
+
+    @pytest.fixture
+    def batch(self):
+        products = [
+            Product(price=95, sku="ref_item", category=1, features=[5, 5, 5]),
+            Product(price=130, sku="ref_item", category=1, features=[5, 5, 5]),
+            Product(price=105, sku="unknown_item", category=1, features=[5, 5, 4]),
+            Product(price=105, sku="unknown_item", category=1, features=[9, 9, 9]),
+            Product(price=120, sku="other_item", category=2, features=[4, 5, 5]),
+        ]
+        return products, self._as_columns(products)
+
+    @staticmethod
+    def _as_columns(products):
+        """Column arrays for eval_products_batch"""
+        return dict(
+            features=np.array([p.features for p in products]),
+            prices=np.array([p.price for p in products]),
+            skus=np.array([p.sku for p in products]),
+            categories=np.array([p.category for p in products]),
+        )
+
+    def test_matches_single_product_api(self, customer, ref_product, batch):
+        """Batch scores should equal scoring each product on its own"""
+        customer.append_memory(ref_product)
+        customer.append_memory(Product(price=110, sku="ref_item", category=1, features=[5, 5, 5]))
+        products, arrays = batch
+
+        scores = customer.eval_products_batch(**arrays, update_mem=False)
+
+        expected = [customer.eval_product(p, update_mem=False) for p in products]
+        assert scores == pytest.approx(expected)
+
+    def test_non_integer_features_rejected(self, customer, batch):
+        """Fractional batch features should raise before anything is scored"""
+        _, arrays = batch
+        arrays["features"] = arrays["features"].astype(float)
+        arrays["features"][3, 1] = 9.5
+
+        with pytest.raises(ValueError, match="'unknown_item' \\(row 3\\)"):
+            customer.eval_products_batch(**arrays)
+
+        assert customer.memory == {}
+
+    def test_integral_float_features_accepted(self, customer, batch):
+        """Whole-number floats should score like their integer equivalents"""
+        _, arrays = batch
+        expected = customer.eval_products_batch(**arrays, update_mem=False)
+        arrays["features"] = arrays["features"].astype(float)
+
+        scores = customer.eval_products_batch(**arrays, update_mem=False)
+
+        assert scores == pytest.approx(expected)
+
+    def test_update_mem_appends_after_scoring(self, customer, ref_product, batch):
+        """All rows should be scored before any of them is remembered"""
+        customer.append_memory(ref_product)
+        products, arrays = batch
+
+        scores = customer.eval_products_batch(**arrays)
+
+        assert scores[4] == pytest.approx(customer.l1_distance([4, 5, 5], [5, 5, 5]) * 100)
+        assert len(customer.memory[1]["ref_item"]) == 3
+        assert len(customer.memory[2]["other_item"]) == 1
+
+    def test_wide_features_are_not_narrowed(self):
+        """Feature values beyond int16 should score the same as in eval_product"""
+        customer = Customer(preferences=[0, 5, 5], max_distance=100000)
+        product = Product(price=10, sku="wide", category=1, features=[70000, 5, 5])
+
+        scores = customer.eval_products_batch(**self._as_columns([product]), update_mem=False)
+
+        assert scores[0] == pytest.approx(30.0)
+        assert scores[0] == pytest.approx(customer.eval_product(product, update_mem=False))
+
+    def test_direct_match_ignores_features(self, customer, ref_product):
+        """A known SKU should use its own memory whatever its features, like eval_product"""
+        customer.append_memory(ref_product)
+        product = Product(price=100, sku="ref_item", category=1, features=[0, 0, 9])
+
+        scores = customer.eval_products_batch(
+            **self._as_columns([product, ref_product]), update_mem=False
+        )
+
+        assert scores[0] == pytest.approx(customer.eval_product(product, update_mem=False))
+        assert scores[0] != pytest.approx(customer.l1_distance([0, 0, 9], [5, 5, 5]) * 100)
+
+    def test_matches_single_product_api_in_large_category(self, customer):
+        """Similarity matches in a category past the pruning threshold should agree too"""
+        rng = np.random.default_rng(0)
+        for i in range(150):
+            customer.append_memory(
+                Product(price=float(rng.uniform(1, 3)), sku=f"item{i % 40}", category=1,
+                        features=rng.integers(0, 8, 3).tolist())
+            )
+        products = [
+            Product(price=float(rng.uniform(1, 3)), sku=f"new{i}", category=1,
+                    features=rng.integers(0, 8, 3).tolist())
+            for i in range(60)
+        ]
+
+        scores = customer.eval_products_batch(**self._as_columns(products), update_mem=False)
+
+        expected = [customer.eval_product(p, update_mem=False) for p in products]
+        assert scores == pytest.approx(expected)
+
+    def test_matches_single_product_api_mixed(self):
+        """Random direct hits and small- and large-category misses should all agree"""
+        rng = np.random.default_rng(3)
+        customer = Customer(preferences=[5, 5, 5], max_distance=27)
+        # Category 1 stays within one tile, 2 is past the pruning threshold
+        # and 3 holds features too large to pack
+        sizes, feature_max = {1: 12, 2: 150, 3: 40}, {1: 8, 2: 8, 3: 300}
+        for category, size in sizes.items():
+            for i in range(size):
+                customer.append_memory(
+                    Product(price=float(rng.uniform(1, 3)), sku=f"item{i % 10}",
+                            category=category,
+                            features=rng.integers(0, feature_max[category], 3).tolist())
+                )
+
+        products = []
+        for i in range(200):
+            category = int(rng.integers(1, 5))
+            sku = f"item{rng.integers(0, 10)}" if rng.random() < 0.4 else f"new{i}"
+            products.append(
+                Product(price=float(rng.uniform(1, 3)), sku=sku, category=category,
+                        features=rng.integers(0, feature_max.get(category, 8), 3).tolist())
+            )
+
+        scores = customer.eval_products_batch(**self._as_columns(products), update_mem=False)
+
+        expected = [customer.eval_product(p, update_mem=False) for p in products]
+        assert scores == pytest.approx(expected)
+
+    def test_invalid_row_appends_nothing(self, customer, ref_product):
+        """A row memory cannot store should reject the batch before any row is appended"""
+        customer.append_memory(ref_product)
+
+        # The second row is a direct match that scores fine, but category 1
+        # stores three features, not four
+        with pytest.raises(ValueError, match="'ref_item' has 4 features"):
+            customer.eval_products_batch(
+                features=np.array([[5, 5, 5, 5], [5, 5, 5, 5]]),
+                prices=np.array([100.0, 100.0]),
+                skus=np.array(["new", "ref_item"]),
+                categories=np.array([2, 1]),
+            )
+
+        assert list(customer.memory) == [1]
+        assert len(customer.memory[1]["ref_item"]) == 1
+
+    @pytest.mark.parametrize("features", [[4], [4, 5, 5, 9]])
+    def test_feature_width_other_than_preferences(self, customer, features):
+        """Widths that differ from preferences should zip like eval_product, not broadcast"""
+        product = Product(price=10, sku="item", category=1, features=features)
+
+        scores = customer.eval_products_batch(**self._as_columns([product]), update_mem=False)
+
+        assert scores[0] == pytest.approx(customer.eval_product(product, update_mem=False))
+
+    def test_empty_batch(self, customer):
+        """An empty batch should return an empty array"""
+        scores = customer.eval_products_batch(
+            features=np.empty((0, 3)),
+            prices=np.empty(0),
+            skus=np.empty(0, dtype=str),
+            categories=np.empty(0, dtype=int),
+        )
+
+        assert scores.shape == (0,)
+
+
+class TestPriceReference:
+    """Tests for the median / MAD price reference"""
+
+    @pytest.mark.parametrize(
+        "prices",
+        [
+            [100],
+            [100, 110],
+            [0.95, 1.00, 1.05],
+            [3, 1, 4, 1, 5, 9, 2, 6],
+            list(range(1, 40, 3)),
+            [5, 5, 5, 1, 9, 5, 2, 30],
+        ],
+    )
+    def test_matches_statistics_median(self, customer, prices):
+        """Reference and uncertainty should match the statistics module"""
+        for price in prices:
+            customer.append_memory(Product(price=price, sku="item1", category=1, features=[5, 5, 5]))
+
+        expected_ref = statistics.median(prices)
+        expected_mad = statistics.median([abs(p - expected_ref) for p in prices])
+
+        ref, rel_uncert = customer.price_refrence(prices)
+        assert ref == pytest.approx(expected_ref, rel=1e-12)
+        assert rel_uncert == pytest.approx(expected_mad / expected_ref, rel=1e-12)
+
+        stored_ref, _, stored_rel_uncert = customer.memory[1]["item1"].price_stats()
+        assert stored_ref == pytest.approx(expected_ref, rel=1e-12)
+        assert stored_rel_uncert == pytest.approx(expected_mad / expected_ref, rel=1e-12)
+
+    def test_stats_memoized_until_append(self, customer):
+        """Price stats should be cached per SKU and refreshed after a new price"""
+        customer.append_memory(Product(price=100, sku="item1", category=1, features=[5, 5, 5]))
+        query = Product(price=0, sku="item1", category=1, features=[5, 5, 5])
+
+        assert customer.access_memory(query).price_stats() == (100, 0.0, 0.0)
+        assert customer.memory[1]["item1"].stats is not None
+
+        customer.append_memory(Product(price=120, sku="item1", category=1, features=[5, 5, 5]))
+        assert customer.memory[1]["item1"].stats is None
+
+        ref, mad, rel_uncert = customer.access_memory(query).price_stats()
+        assert ref == pytest.approx(110)
+        assert mad == pytest.approx(10)
+        assert rel_uncert == pytest.approx(10 / 110)
+
+    def test_stats_from_sorted_prices(self, customer):
+        """Stats kept from the sorted copy should match a fresh computation"""
+        rng = np.random.default_rng(0)
+        query = Product(price=0, sku="item1", category=1, features=[5, 5, 5])
+
+        for price in rng.integers(50, 150, size=25).tolist():
+            customer.append_memory(Product(price=price, sku="item1", category=1, features=[5, 5, 5]))
+            store = customer.access_memory(query)
+
+            ref, _, rel_uncert = store.price_stats()
+            assert (ref, rel_uncert) == pytest.approx(customer.price_refrence(store.prices))